@@ -1,3 +1,8 @@
+import sqlite3
+from functools import partial
+from os import getenv
+from os.path import join as joinpath
+from pathlib import Path
 from typing import List, Optional
 
 from sqlalchemy import create_engine
@@ -5,12 +10,42 @@ from sqlalchemy.orm import sessionmaker
 
 from lrlib import utils, wfindex
 
-DEBUG = True
+# Set LRLIB_DEBUG=1 to echo all SQL statements.
+DEBUG = getenv('LRLIB_DEBUG') == '1'
+
+# The catalog is only read, never written. SQLite can then keep
+# (memory-mapped) database pages around.
+PRAGMAS = {
+    'query_only': 1,
+    'temp_store': 'MEMORY',
+    'cache_size': -65536,       # 64 MiB
+    'mmap_size': 1073741824,    # 1 GiB
+}
 
 
 Session = sessionmaker()
 
 
+def connect_read_only(path: str) -> sqlite3.Connection:
+    """Opens an SQLite database file for reading.
+
+    The database is opened read-only, but not as immutable: Lightroom
+    may sync into the catalog while it is open, and SQLite must then
+    still take its locks to read consistent rows.
+
+    Args:
+        path: Path to the database file.
+
+    Returns:
+        The database connection, with `PRAGMAS` applied.
+    """
+    uri = Path(path).resolve().as_uri() + '?mode=ro'
+    connection = sqlite3.connect(uri, uri=True)
+    for name, value in PRAGMAS.items():
+        connection.execute('PRAGMA {:s} = {}'.format(name, value))
+    return connection
+
+
 class Terminal:
     @staticmethod
     def select_item(items: List[str], prompt='Select') -> str:
@@ -22,21 +57,24 @@ class Terminal:
 
 
 class Base(Terminal):
-    def __init__(self, catalog_path: str) -> None:
+    def __init__(self, catalog_path: str, debug: bool = DEBUG) -> None:
         self.catalog_path = catalog_path
-        self.debug = DEBUG
+        self.debug = debug
         self.session = None
 
     def __enter__(self) -> 'Base':
         """Context manager for the database session.
         """
         sources = [
-            (wfindex.Base, 'sqlite:///{:s}/Managed Catalog.wfindex'),
+            (wfindex.Base, 'Managed Catalog.wfindex'),
         ]
 
-        binds = {base: create_engine(db_file.format(self.catalog_path),
-                                     echo=self.debug)
-                 for base, db_file in sources}
+        binds = {}
+        for base, db_file in sources:
+            connect = partial(connect_read_only,
+                              joinpath(self.catalog_path, db_file))
+            binds[base] = create_engine('sqlite://', creator=connect,
+                                        echo=self.debug)
         # https://github.com/sqlalchemy/sqlalchemy/issues/4829
         binds.update({table: engine for base, engine in binds.items()
                       for table in base.metadata.tables.values()})
@@ -1,11 +1,15 @@
-from os import getenv, listdir
+from functools import lru_cache
+from os import getenv, scandir
 from os.path import isfile, join as joinpath
 from typing import List
 
 
+@lru_cache(maxsize=1)
 def discover_catalogs() -> List[str]:
     """Discover all catalog folders.
 
+    The result is cached, so the disk is scanned only once.
+
     Returns:
         A list of discovered catalog folders.
     """
@@ -13,5 +17,7 @@ def discover_catalogs() -> List[str]:
     # let me know where the file Managed Catalog.wfindex is.
     req = 'Managed Catalog.wfindex'
     base = joinpath(getenv('LOCALAPPDATA'), 'Adobe', 'Lightroom CC', 'Data')
-    guesses = (joinpath(base, fld) for fld in listdir(base))
-    return [path for path in guesses if isfile(joinpath(path, req))]
+    with scandir(base) as entries:
+        return [entry.path for entry in entries
+                if entry.is_dir(follow_symlinks=False)
+                and isfile(joinpath(entry.path, req))]
@@ -9,7 +9,8 @@ simply dumped into this one folder. No albums. Now use this script to
 re-organise the photos into folders matching your Lightroom library.
 
 Usage:
-    make_albums.py FOLDER [--indexed | --natural] [-l PATH] [-r ALBUM]
+    make_albums.py FOLDER [--indexed | --natural] [--copies] [-l PATH]
+                   [-r ALBUM]
     make_albums.py list albums [-l PATH]
     make_albums.py -h | --help
     make_albums.py --version
@@ -27,6 +28,11 @@ Options:
                             aaa-2.jpg, etc. Although this preserves file
                             names, it does not maintain the order of
                             photos in the albums.
+    --copies                Photos that are in more than one album are
+                            stored as independent copies (copy-on-write
+                            clones where the file system supports it).
+                            By default they are hard links to one file,
+                            so editing one edits all.
     -l PATH --library=PATH  Path to the folder containing the Lightroom
                             library (Managed Catalog.wfindex).
     -r ALBUM --root=ALBUM   Specify the folder / album that you exported
@@ -43,15 +49,19 @@ https://opensource.org/licenses/MIT
 """
 # TODO: Support non-Windows platforms. Need users.
 from collections import defaultdict
+from itertools import groupby
 from operator import attrgetter
+from os import sep
 from os.path import join as joinpath
 from typing import (Any, Dict, Optional, Type, Union)
 
 from docopt import docopt
+from sqlalchemy import func
 
 from lrlib import app
 from lrlib.wfindex import Asset, Album, album_asset
-from utils.naming import AssetNamer, IndexedNamer, NaturalNamer
+from utils.naming import (AssetNamer, IndexedNamer, NaturalNamer,
+                          natural_name)
 from utils import dbtools, filetools
 
 
@@ -93,16 +103,29 @@ class App(app.Base):
     def print_album_tree(self) -> None:
         """Prints all albums and their album IDs.
         """
-        def print_album_with_id(album: Album, indent: str) -> None:
-            print('{:s}{:s} {:s}'.format(album.albumId, indent, album.name))
-            for a in album.children:
-                print_album_with_id(a, indent + '  ')
+        hierarchy = dbtools.adjacency_list(self.session, Album, Album.parent)
+        albums = (self.session
+                  .query(hierarchy.c.albumId, hierarchy.c.parentId,
+                         hierarchy.c.name)
+                  .order_by(hierarchy.c.nameLC))
 
-        albums = self.session.query(Album).order_by(Album.nameLC)
-        for root_album in dbtools.fetch_as_tree(albums, Album.parent):
-            print_album_with_id(root_album, '')
+        children = defaultdict(list)
+        for album in albums:
+            children[album.parentId].append(album)
+
+        # Depth-first walk with one iterator per level of the tree.
+        stack = [iter(children[None])]
+        while stack:
+            album = next(stack[-1], None)
+            if album is None:
+                stack.pop()
+                continue
+            indent = '  ' * (len(stack) - 1)
+            print('{:s}{:s} {:s}'.format(album.albumId, indent, album.name))
+            stack.append(iter(children[album.albumId]))
 
-    def organise(self, folder: str, root: Optional[str] = None) -> None:
+    def organise(self, folder: str, root: Optional[str] = None,
+                 link: bool = True) -> None:
         """Organise exported files into their album/folder hierarchy.
 
         Args:
@@ -111,6 +134,8 @@ class App(app.Base):
                 specified as an album ID, or the special keyword `all`
                 if all albums were exported. If omitted, the user is
                 asked to select from the list.
+            link: If True, photos in several albums are hard linked.
+                Otherwise they are copied.
 
         Notes:
             The output folder structure will be relative to the root. In
@@ -118,33 +143,61 @@ class App(app.Base):
         """
         parent_prop = Album.parent
 
-        albums = dbtools.adjacency_list(self.session, Album, parent_prop, root)
-        albums = self.session.query(albums).all()
-        album_ids = set(map(attrgetter('albumId'), albums))
+        hierarchy = dbtools.adjacency_list(self.session, Album, parent_prop,
+                                           root, path_field='name',
+                                           separator=sep)
+
+        albums = self.session.query(hierarchy.c.albumId, hierarchy.c.path)
 
-        album_path = {root: self.output_namer(folder)}
+        album_path = {}
         for album in albums:
-            path = joinpath(album_path[album.parentId].folder, album.name)
+            path = joinpath(folder, album.path)
             album_path[album.albumId] = self.output_namer(path)
 
-        # Find all pairs of file names, source -> destination.
-        filename_mapping = defaultdict(list)
-        input_path = NaturalNamer(folder)
-
+        # Number the exported assets that share a file name, as the
+        # export did: "a.jpg", "a-2.jpg", etc.
+        order = (Asset.captureDate, Asset.filenameLC, Asset.assetId)
+        occurrence = (func.row_number()
+                      .over(partition_by=Asset.filename, order_by=order)
+                      .label('occurrence'))
+
+        exported = (self.session
+                    .query(Asset.assetId, occurrence)
+                    .filter(Asset.assetId.in_(
+                        self.session
+                        .query(album_asset.c.assetId)
+                        .join(hierarchy,
+                              hierarchy.c.albumId == album_asset.c.albumId)))
+                    .subquery())
+
+        # Ordering by assetId last keeps all rows of one asset together.
         asset_query = (self.session
-                       .query(Asset.assetId, Asset.filename, album_asset.c.albumId)
+                       .query(Asset.assetId, Asset.filename, album_asset.c.albumId,
+                              exported.c.occurrence)
+                       .select_from(Asset)
                        .join(album_asset)
-                       .filter(album_asset.c.albumId.in_(album_ids))
-                       .order_by(Asset.captureDate, Asset.filenameLC))
+                       .join(hierarchy,
+                             hierarchy.c.albumId == album_asset.c.albumId)
+                       .join(exported, exported.c.assetId == Asset.assetId)
+                       .order_by(*order))
 
-        for row in asset_query:
-            filename_mapping[input_path(row)].append(
-                    album_path[row.albumId](row))
+        # Find all pairs of file names, source -> destination.
+        filename_mapping = {}
+
+        for _, rows in groupby(asset_query, key=attrgetter('assetId')):
+            rows = list(rows)
+            first = rows[0]
+            src = joinpath(folder,
+                           natural_name(first.filename, first.occurrence))
+            # Drop repeated destinations, which would be linked onto
+            # themselves. dict keeps them in order, unlike set.
+            filename_mapping[src] = tuple(dict.fromkeys(
+                album_path[row.albumId](row) for row in rows))
 
         # Renaming files runs in parallel.
         print('Move files into album folders...')
 
-        for failed in filetools.move_many_to_many(filename_mapping):
+        for failed in filetools.move_many_to_many(filename_mapping, link):
             print(f'File not found: {failed!r}')
 
         print('done.')
@@ -171,7 +224,8 @@ def main(args: Dict[str, Union[str, bool]]) -> None:
             app.print_album_tree()
 
         else:
-            app.organise(args['FOLDER'], args['--root'])
+            app.organise(args['FOLDER'], args['--root'],
+                         not args['--copies'])
 
 
 if __name__ == '__main__':
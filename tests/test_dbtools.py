@@ -0,0 +1,71 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, aliased
+
+from lrlib.wfindex import Album, Base
+from utils import dbtools
+
+
+class AdjacencyListTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.session = Session(create_engine('sqlite://'))
+        Base.metadata.create_all(self.session.get_bind())
+        self.session.add_all([
+            Album(albumId=album_id, parentId=parent_id, name=name,
+                  nameLC=name.lower())
+            for album_id, parent_id, name in [
+                ('b', None, 'B'),
+                ('a', None, 'A'),
+                ('a2', 'a', 'A2'),
+                ('a1', 'a', 'A1'),
+                ('a1x', 'a1', 'A1x'),
+                ('b1', 'b', 'B1'),
+            ]
+        ])
+        self.session.commit()
+
+    def tearDown(self) -> None:
+        self.session.close()
+
+    def depth_first(self, root_value=None):
+        tree = dbtools.adjacency_list(self.session, Album,
+                                      root_value=root_value)
+        return (self.session
+                .query(aliased(Album, tree), tree.c.depth)
+                .order_by(tree.c.trail))
+
+    def test_trail_is_depth_first(self) -> None:
+        rows = [(album.albumId, depth) for album, depth in self.depth_first()]
+        self.assertEqual(rows, [('a', 0), ('a1', 1), ('a1x', 2), ('a2', 1),
+                                ('b', 0), ('b1', 1)])
+
+    def test_fetch_as_tree_iter(self) -> None:
+        nodes = list(dbtools.fetch_as_tree_iter(self.depth_first()))
+
+        # Post-order: every subtree is complete when its root comes.
+        self.assertEqual([node.albumId for node in nodes],
+                         ['a1x', 'a1', 'a2', 'a', 'b1', 'b'])
+        children = {node.albumId: [child.albumId for child in node.children]
+                    for node in nodes}
+        self.assertEqual(children, {'a': ['a1', 'a2'], 'a1': ['a1x'],
+                                    'a1x': [], 'a2': [], 'b': ['b1'],
+                                    'b1': []})
+
+    def test_fetch_as_tree_iter_sub_tree(self) -> None:
+        nodes = list(dbtools.fetch_as_tree_iter(self.depth_first('a')))
+        self.assertEqual([node.albumId for node in nodes],
+                         ['a1x', 'a1', 'a2'])
+
+    def test_fetch_as_tree_iter_empty(self) -> None:
+        self.assertEqual(list(dbtools.fetch_as_tree_iter([])), [])
+
+    def test_fetch_as_tree_iter_out_of_order(self) -> None:
+        rows = self.depth_first().all()
+        for bad in (rows[1:], rows[::-1], rows[:1] + rows[2:]):
+            with self.assertRaises(ValueError):
+                list(dbtools.fetch_as_tree_iter(bad, Album.parent))
+
+
+if __name__ == '__main__':
+    unittest.main()
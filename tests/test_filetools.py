@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from os.path import join as joinpath
+
+from utils import filetools
+
+
+class MoveManyToManyTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.folder.name)
+
+    def tearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    def test_bare_file_names(self) -> None:
+        with open('a', 'w') as f:
+            f.write('a')
+        self.assertEqual(filetools.move_many_to_many({'a': ('b',)}), [])
+        self.assertEqual(os.listdir('.'), ['b'])
+
+    def test_folders_and_missing_sources(self) -> None:
+        with open('a', 'w') as f:
+            f.write('a')
+        failed = filetools.move_many_to_many({
+            'a': (joinpath('x', 'a'), joinpath('y', 'z', 'a')),
+            'missing': (joinpath('x', 'missing'),),
+        })
+        self.assertEqual(failed, ['missing'])
+        for path in (joinpath('x', 'a'), joinpath('y', 'z', 'a')):
+            with open(path) as f:
+                self.assertEqual(f.read(), 'a')
+        self.assertFalse(os.path.exists('a'))
+
+    def test_copies(self) -> None:
+        with open('a', 'w') as f:
+            f.write('a')
+        filetools.move_many_to_many(
+            {'a': (joinpath('x', 'a'), joinpath('y', 'a'), 'b')}, link=False)
+        for path in (joinpath('x', 'a'), joinpath('y', 'a'), 'b'):
+            with open(path) as f:
+                self.assertEqual(f.read(), 'a')
+        self.assertFalse(os.path.samefile(joinpath('x', 'a'), 'b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
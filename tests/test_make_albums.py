@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from os.path import join as joinpath
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from lrlib.wfindex import Album, Asset, Base, album_asset
+from make_albums import App
+from utils.naming import IndexedNamer, NaturalNamer
+
+
+def make_catalog(path: str) -> None:
+    """Writes a small catalog: two albums under one, and three photos.
+    """
+    engine = create_engine('sqlite:///' + joinpath(path,
+                                                   'Managed Catalog.wfindex'))
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.add_all([
+            Album(albumId='r', parentId=None, name='Trips', nameLC='trips'),
+            Album(albumId='a', parentId='r', name='Alps', nameLC='alps'),
+            Album(albumId='b', parentId='r', name='Beach', nameLC='beach'),
+            Asset(assetId='1', filename='IMG.CR2', filenameLC='img.cr2',
+                  captureDate='2019-01-01'),
+            Asset(assetId='2', filename='IMG.CR2', filenameLC='img.cr2',
+                  captureDate='2019-01-02'),
+            Asset(assetId='3', filename='clip.MOV', filenameLC='clip.mov',
+                  captureDate='2019-01-03'),
+        ])
+        session.flush()
+        session.execute(album_asset.insert(), [
+            {'assetId': '1', 'albumId': 'a', 'sortOrder': '1'},
+            {'assetId': '2', 'albumId': 'a', 'sortOrder': '2'},
+            {'assetId': '2', 'albumId': 'b', 'sortOrder': '1'},
+            {'assetId': '3', 'albumId': 'b', 'sortOrder': '2'},
+        ])
+        session.commit()
+    engine.dispose()
+
+
+class OrganiseTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.catalog = tempfile.TemporaryDirectory()
+        self.export = tempfile.TemporaryDirectory()
+        make_catalog(self.catalog.name)
+        for name in ('IMG.jpg', 'IMG-2.jpg', 'clip.MOV'):
+            with open(joinpath(self.export.name, name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self) -> None:
+        self.catalog.cleanup()
+        self.export.cleanup()
+
+    def organise(self, output_namer) -> dict:
+        with App(output_namer=output_namer,
+                 catalog_path=self.catalog.name) as app:
+            app.organise(self.export.name, 'r')
+
+        files = {}
+        for folder, _, names in os.walk(self.export.name):
+            for name in names:
+                path = joinpath(folder, name)
+                with open(path) as f:
+                    files[os.path.relpath(path, self.export.name)] = f.read()
+        return files
+
+    def test_indexed(self) -> None:
+        self.assertEqual(self.organise(IndexedNamer), {
+            joinpath('Alps', '1.IMG.jpg'): 'IMG.jpg',
+            joinpath('Alps', '2.IMG.jpg'): 'IMG-2.jpg',
+            joinpath('Beach', '1.IMG.jpg'): 'IMG-2.jpg',
+            joinpath('Beach', '2.clip.MOV'): 'clip.MOV',
+        })
+
+    def test_natural(self) -> None:
+        self.assertEqual(self.organise(NaturalNamer), {
+            joinpath('Alps', 'IMG.jpg'): 'IMG.jpg',
+            joinpath('Alps', 'IMG-2.jpg'): 'IMG-2.jpg',
+            joinpath('Beach', 'IMG.jpg'): 'IMG-2.jpg',
+            joinpath('Beach', 'clip.MOV'): 'clip.MOV',
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
 from collections import defaultdict
-from os import getenv, listdir
+from itertools import chain
+from operator import attrgetter
+from os import getenv, scandir
 from os.path import isfile, join as joinpath
-from typing import List, Optional, Union
+from typing import Callable, Iterator, List, Optional, Union
 
+from sqlalchemy import Integer, String, cast, func, literal
 from sqlalchemy.ext.declarative import DeclarativeMeta
-from sqlalchemy.orm import Query, aliased
+from sqlalchemy.orm import Query, aliased, selectinload
 from sqlalchemy.orm.attributes import (set_committed_value,
                                        InstrumentedAttribute)
 
@@ -12,8 +15,12 @@ from sqlalchemy.orm.attributes import (set_committed_value,
 def adjacency_list(session,
                    model,
                    relationship: Optional[InstrumentedAttribute] = None,
-                   root_value: Union[str, None] = None):
-    """Returns a query for all records in an adjacency list.
+                   root_value: Union[str, None] = None,
+                   path_field: Optional[str] = None,
+                   separator: str = '/',
+                   scope: Optional[Callable] = None,
+                   max_depth: Optional[int] = None):
+    """Returns a subquery for all records in an adjacency list.
 
     Args:
         session: The SQLAlchemy database session.
@@ -23,9 +30,36 @@ def adjacency_list(session,
         root_value: Parent property's value at the root nodes.
             Default is None, which commonly retrieves the whole
             structure.
+        path_field: Optional. Name of a (string) column to build a
+            materialised path from. If set, the CTE has an extra
+            column `path` that joins the field's values from the
+            root down to each record, for example `"2019/Summer"`.
+        separator: The string placed between path components.
+        scope: Optional. A function that takes the model (or an alias
+            of it) and returns a filter criterion, for example
+            `lambda a: a.subtype == AlbumType.collection`. It is applied
+            to both terms of the CTE, so records outside the scope and
+            their descendants are never visited.
+        max_depth: Optional. Records deeper than this are not
+            retrieved; 0 returns only the records directly under the
+            root.
 
     Returns:
-        A Query that retrieves all model objects using a CTE.
+        A Subquery named `tree` that selects the records from a
+        recursive CTE. It has the model's columns, not model objects,
+        and a column `depth`, which is 0 for the records directly
+        under the root and increases by one per level down. The column
+        `trail` holds the child values from the root down, as in
+        `">a,>b,"`. Ordering by it puts the records in depth-first
+        order, as long as the child values don't contain characters
+        that sort before `","`. With `path_field` set there is also
+        the column `path`. Select from it with
+        `session.query(tree.c.<column>, ...)`, or map it to the model
+        with `aliased(model, tree)`.
+
+    Notes:
+        Records that are their own ancestor (a loop of parent values)
+        are skipped instead of making the recursion run forever.
     """
     if relationship is None:
         relationship = model.parent
@@ -33,28 +67,55 @@ def adjacency_list(session,
     parent_field = relationship.expression.right.name
     child_field = relationship.expression.left.name
 
-    hierarchy = (session.query(model)
-                 .filter(getattr(model, parent_field) == root_value)
-                 .cte(name='hierarchy', recursive=True))
+    # Trail of child values, `>a,>b,`, to detect loops in the tree.
+    def trail_key(entity):
+        return literal('>', String) + cast(getattr(entity, child_field),
+                                           String) + ','
+
+    anchor = session.query(model, literal(0, Integer).label('depth'),
+                           trail_key(model).label('trail'))
+    if path_field is not None:
+        anchor = anchor.add_columns(
+            getattr(model, path_field).label('path'))
+
+    anchor = anchor.filter(getattr(model, parent_field) == root_value)
+    if scope is not None:
+        anchor = anchor.filter(scope(model))
+
+    hierarchy = anchor.cte(name='hierarchy', recursive=True)
 
     h = aliased(hierarchy, name='h')
     m = aliased(model, name='m')
-    hierarchy = hierarchy.union_all(
-        session.query(m)
-        .filter(getattr(m, parent_field) == getattr(h.c, child_field))
-    )
 
-    return hierarchy
+    recursive = session.query(m, (h.c.depth + 1).label('depth'),
+                              (h.c.trail + trail_key(m)).label('trail'))
+    if path_field is not None:
+        recursive = recursive.add_columns(
+            (h.c.path + separator + getattr(m, path_field)).label('path'))
+
+    recursive = recursive.filter(
+        getattr(m, parent_field) == getattr(h.c, child_field))
+    recursive = recursive.filter(func.instr(h.c.trail, trail_key(m)) == 0)
+    if scope is not None:
+        recursive = recursive.filter(scope(m))
+    if max_depth is not None:
+        recursive = recursive.filter(h.c.depth < max_depth)
+
+    hierarchy = hierarchy.union_all(recursive)
+
+    return session.query(*hierarchy.c).subquery('tree')
 
 
 def fetch_as_tree(query: Query,
                   relationship: Optional[InstrumentedAttribute] = None,
                   root_value: Union[str, None] = None,
+                  strategy: str = 'single',
+                  max_depth: Optional[int] = None,
                   ) -> List[DeclarativeMeta]:
     """Builds the full tree for the given table (adjacency list).
 
-    This method is efficient in the sense that it issues only one SELECT
-    query to the database.
+    With the default strategy, this method is efficient in the sense
+    that it issues only one SELECT query to the database.
 
     Args:
         query: A query that selects all relevant model records, that
@@ -62,35 +123,129 @@ def fetch_as_tree(query: Query,
             example: `session.query(Album).order_by(Album.nameLC)`.
         relationship: The parent/child relationship that describes
             both fields (columns). For example: `Album.parent`
-            If not set, one record is fetched from the query to read
-            its `parent` property.
+            If not set, the `parent` property of the query's (first)
+            entity is used.
         root_value: Parent property's value at the root nodes.
             Default is None, which commonly retrieves the whole
             structure.
+        strategy: How the tree is loaded.
+            `"single"`: all records are selected at once and linked up
+            in Python.
+            `"selectin"`: the root nodes are selected, and then their
+            children with SQLAlchemy's `selectinload`, one SELECT per
+            level. This can be faster for shallow trees.
+        max_depth: Required for the `"selectin"` strategy, and ignored
+            otherwise. Children are loaded for the records down to this
+            depth, where the root nodes are at depth 0. It must be 1 or
+            more, and is passed to `selectinload` as `recursion_depth`.
 
     Returns:
         A list of root nodes with child nodes (the tree) pre-fetched
         recursively.
+
+    Raises:
+        ValueError: If the strategy is unknown, or `max_depth` is not
+            set to 1 or more for the `"selectin"` strategy.
     """
+    if strategy not in ('single', 'selectin'):
+        raise ValueError(f'Unknown strategy: {strategy!r}')
+    if strategy == 'selectin' and (max_depth is None or max_depth < 1):
+        raise ValueError(f'The selectin strategy needs max_depth >= 1, '
+                         f'not {max_depth!r}')
+
     if relationship is None:
-        # Fetch one record to discover the parent relationship.
-        relationship = next(iter(query)).__class__.parent
+        relationship = query.column_descriptions[0]['entity'].parent
 
-    parent_field = relationship.expression.right.name
-    child_field = relationship.expression.left.name
+    if strategy == 'selectin':
+        model = relationship.class_
+        parent_field = relationship.expression.right.name
+        children = getattr(model, relationship.property.back_populates)
+        return (query
+                .filter(getattr(model, parent_field) == root_value)
+                .options(selectinload(children, recursion_depth=max_depth))
+                .all())
+
+    parent_key = attrgetter(relationship.expression.right.name)
+    child_key = attrgetter(relationship.expression.left.name)
     back_populates = relationship.property.back_populates
 
     nodes = query.all()
 
     children = defaultdict(list)
     for node in nodes:
-        children[getattr(node, parent_field)].append(node)
+        children[parent_key(node)].append(node)
 
+    # Look up with .get, so leaves don't add empty lists to `children`.
+    no_children = ()
     for node in nodes:
         set_committed_value(node, back_populates,
-                            children[getattr(node, child_field)])
+                            children.get(child_key(node), no_children))
+
+    return children.get(root_value, [])
+
+
+def fetch_as_tree_iter(query: Query,
+                       relationship: Optional[InstrumentedAttribute] = None,
+                       ) -> Iterator[DeclarativeMeta]:
+    """Lazily builds the tree for the given table (adjacency list).
+
+    Unlike `fetch_as_tree`, the rows are not all loaded first. Only the
+    nodes on the path from the root to the current row are kept, so a
+    caller can process each subtree and let go of it.
+
+    Args:
+        query: A query with rows `(record, depth)` in depth-first
+            order: every record follows its parent and comes before
+            its parent's next sibling. The depth is as in the `depth`
+            column of `adjacency_list`. For example, with
+            `tree = adjacency_list(session, Album)`:
+            `session.query(aliased(Album, tree), tree.c.depth)
+            .order_by(tree.c.trail)`.
+        relationship: The parent/child relationship that describes
+            both fields (columns). For example: `Album.parent`
+            If not set, it is read from the first record's `parent`
+            property.
+
+    Yields:
+        Each node as soon as its subtree is complete, with its child
+        nodes pre-fetched recursively. Children come before their
+        parent (post-order). Root nodes have depth 0.
+
+    Raises:
+        ValueError: If a record is not a child of the record above
+            it in the tree, i.e. the rows are not in depth-first order.
+            This includes a first row with a depth other than 0.
+    """
+    rows = iter(query)
+    first = next(rows, None)
+    if first is None:
+        return
+
+    if relationship is None:
+        relationship = first[0].__class__.parent
+
+    parent_key = attrgetter(relationship.expression.right.name)
+    child_key = attrgetter(relationship.expression.left.name)
+    back_populates = relationship.property.back_populates
+
+    # Open nodes from the root down, each with its children so far.
+    stack = []
+    for node, depth in chain((first,), rows):
+        while len(stack) > depth:
+            parent, kids = stack.pop()
+            set_committed_value(parent, back_populates, kids)
+            yield parent
+        if depth != len(stack) or (
+                stack and parent_key(node) != child_key(stack[-1][0])):
+            raise ValueError('Rows are not in depth-first order.')
+        if stack:
+            stack[-1][1].append(node)
+        stack.append((node, []))
 
-    return children[root_value]
+    while stack:
+        parent, kids = stack.pop()
+        set_committed_value(parent, back_populates, kids)
+        yield parent
 
 
 def user_catalogs() -> List[str]:
@@ -112,5 +267,7 @@ def user_catalogs() -> List[str]:
     # let me know where the file Managed Catalog.wfindex is.
     base = joinpath(getenv('LOCALAPPDATA'),
                     'Adobe', 'Lightroom CC', 'Data')
-    guesses = (joinpath(base, fld) for fld in listdir(base))
-    return [path for path in guesses if isfile(joinpath(path, req))]
+    with scandir(base) as entries:
+        return [entry.path for entry in entries
+                if entry.is_dir(follow_symlinks=False)
+                and isfile(joinpath(entry.path, req))]
@@ -1,54 +1,311 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from genericpath import isfile
+import ctypes
+import errno
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from itertools import islice
 from logging import getLogger
 from os import makedirs, remove
-from os.path import split as splitpath
-from shutil import copy2, move as movefile
-from typing import Collection, Dict, List
+from os.path import dirname
+from shutil import SameFileError, copyfileobj, copystat
+from typing import (Callable, Collection, Dict, Iterable, Iterator, List,
+                    Tuple, TypeVar)
 
 logger = getLogger(__name__)
 
+T = TypeVar('T')
 
-def move_to_many(src: str, dsts: Collection[str]) -> None:
+COPY_BUFSIZE = 1 << 20
+
+# File moves wait on the disk, not the CPU, so use more threads than cores.
+MAX_WORKERS = min(64, (os.cpu_count() or 1) * 4)
+
+# Most files submitted to the thread pool at once, per task.
+BATCH_SIZE = 256
+
+# Errors raised by the kernel copy calls when they do not support the
+# given pair of files. The copy then falls back to the next method.
+_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP,
+                errno.EXDEV}
+
+# Errors raised by `os.link` when the destination can't be a hard link.
+# The file is then copied instead. EINVAL is what file systems without
+# hard links (FAT32, exFAT, SMB shares) give on Windows.
+_NO_LINK = {errno.EEXIST, errno.EINVAL, errno.EMLINK, errno.ENOTSUP,
+            errno.EPERM, errno.EXDEV}
+
+# The same for Windows error codes: ERROR_INVALID_FUNCTION,
+# ERROR_NOT_SAME_DEVICE, ERROR_NOT_SUPPORTED, ERROR_TOO_MANY_LINKS.
+_NO_LINK_WINERROR = {1, 17, 50, 1142}
+
+# Errors raised by `clonefile` when the destination can't be a clone.
+_NO_CLONE = {errno.EEXIST, errno.ENOTSUP, errno.EXDEV}
+
+if sys.platform == 'win32':
+    _kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+else:
+    _kernel32 = None
+
+if sys.platform == 'darwin':
+    _clonefile = getattr(ctypes.CDLL(None, use_errno=True), 'clonefile', None)
+else:
+    _clonefile = None
+
+
+def _copy_file_range(fd_in: int, fd_out: int, size: int) -> int:
+    """Copies `size` bytes between file descriptors with copy_file_range.
+
+    On copy-on-write file systems (btrfs, xfs) this makes a reflink.
+    """
+    copied = 0
+    while copied < size:
+        sent = os.copy_file_range(fd_in, fd_out, size - copied)
+        if not sent:
+            break
+        copied += sent
+    return copied
+
+
+def _sendfile(fd_in: int, fd_out: int, size: int) -> int:
+    """Copies `size` bytes between file descriptors with sendfile.
+    """
+    copied = 0
+    while copied < size:
+        sent = os.sendfile(fd_out, fd_in, copied, COPY_BUFSIZE)
+        if not sent:
+            break
+        copied += sent
+    return copied
+
+
+_kernel_copies: List[Callable[[int, int, int], int]] = []
+if hasattr(os, 'copy_file_range'):
+    _kernel_copies.append(_copy_file_range)
+if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+    _kernel_copies.append(_sendfile)
+
+
+def _fastcopy(src: str, dst: str) -> None:
+    """Copy the contents of a file without passing it through Python.
+
+    On Windows this is `CopyFileW`. Elsewhere `os.copy_file_range` is
+    tried first, then `os.sendfile`, and finally a plain buffered copy.
+    File metadata is not copied.
+
+    Args:
+        src: Source path, a string.
+        dst: Destination path, a string. Overwritten if it exists.
+
+    Raises:
+        OSError: If fewer bytes were copied than the source holds. The
+            caller must then not remove the source.
+    """
+    if _kernel32 is not None:
+        if not _kernel32.CopyFileW(src, dst, False):
+            code = ctypes.get_last_error()
+            raise OSError(None, ctypes.FormatError(code), src, code)
+        return
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fd_in, fd_out = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(fd_in).st_size
+
+        for kernel_copy in _kernel_copies:
+            try:
+                copied = kernel_copy(fd_in, fd_out, size)
+            except OSError as err:
+                # Only fall back if nothing has been written yet.
+                if err.errno not in _UNSUPPORTED or fdst.tell():
+                    raise
+                continue
+            # Some file systems return 0 at once instead of failing.
+            if copied or not size:
+                break
+        else:
+            copyfileobj(fsrc, fdst, COPY_BUFSIZE)
+            copied = fdst.tell()
+
+    if copied != size:
+        raise OSError(errno.EIO,
+                      f'Copied {copied:d} of {size:d} bytes', src)
+
+
+def _samefile(src: str, dst: str) -> bool:
+    """Tells if both paths are the same file, like `shutil` does.
+
+    This is also true for a hard link, or for a name that differs only
+    in case on a case-insensitive file system.
+    """
+    try:
+        return os.path.samefile(src, dst)
+    except OSError:
+        return False
+
+
+def _copy(src: str, dst: str) -> None:
+    """Copy a file with its metadata, like `shutil.copy2`.
+
+    Raises:
+        SameFileError: If `dst` is `src`. Opening it for writing would
+            truncate the file.
+    """
+    if _samefile(src, dst):
+        raise SameFileError(f'{src!r} and {dst!r} are the same file')
+    _fastcopy(src, dst)
+    copystat(src, dst)
+
+
+def _move(src: str, dst: str) -> None:
+    """Move a file, like `shutil.move`.
+
+    A rename is attempted first, which costs no I/O when source and
+    destination are on the same file system.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+        _copy(src, dst)
+        remove(src)
+
+
+def _link(src: str, dst: str) -> None:
+    """Hard link a file, or copy it where links are not possible.
+
+    Nothing is done if `dst` already is the same file as `src`.
+    """
+    try:
+        os.link(src, dst)
+    except OSError as err:
+        if err.errno == errno.EEXIST and _samefile(src, dst):
+            return
+        if (err.errno not in _NO_LINK
+                and getattr(err, 'winerror', None) not in _NO_LINK_WINERROR):
+            raise
+        _copy(src, dst)
+
+
+def _clone(src: str, dst: str) -> bool:
+    """Make a copy-on-write clone of a file, with its metadata.
+
+    This is `clonefile` on macOS. On Linux, `_copy` already makes a
+    reflink (through `copy_file_range`) where the file system can.
+
+    Returns:
+        True if the clone was made, False if the file system (or the
+        platform) doesn't support cloning it.
+    """
+    if _clonefile is None:
+        return False
+    if not _clonefile(os.fsencode(src), os.fsencode(dst), 0):
+        return True
+    code = ctypes.get_errno()
+    if code not in _NO_CLONE:
+        raise OSError(code, os.strerror(code), src)
+    return False
+
+
+def _fanout_copy(src: str, dsts: Collection[str]) -> None:
+    """Copy one file to many destinations, as independent files.
+
+    Each destination is a clone (macOS) or reflink (Linux) where the
+    file system supports it. Otherwise it is copied in the kernel
+    (Linux, Windows) or, elsewhere, all at once while reading the
+    source only once.
+    Destinations that already are the source file are skipped.
+    """
+    rest = [dst for dst in dsts
+            if not _samefile(src, dst) and not _clone(src, dst)]
+
+    if _kernel32 is not None or _kernel_copies or len(rest) < 2:
+        for dst in rest:
+            _copy(src, dst)
+        return
+
+    with ExitStack() as stack:
+        fsrc = stack.enter_context(open(src, 'rb'))
+        fdsts = [stack.enter_context(open(dst, 'wb')) for dst in rest]
+
+        buf = bytearray(COPY_BUFSIZE)
+        view = memoryview(buf)
+        size = fsrc.readinto(buf)
+        while size:
+            for fdst in fdsts:
+                fdst.write(view[:size])
+            size = fsrc.readinto(buf)
+
+    for dst in rest:
+        copystat(src, dst)
+
+
+def move_to_many(src: str, dsts: Collection[str], link: bool = True) -> None:
     """Move one file to one or more destinations.
 
     Args:
         src: Source path, a string.
         dsts: Destination paths, a collection of one or more strings.
-            For single destinations, `shutil.move` is used. For multiple
-            destinations, `shutil.copy2` is used and the source file is
-            deleted after all copies have been successful.
+            The file is moved to the first destination: renamed, or
+            copied and deleted if it moves to another device. All other
+            destinations are duplicates of the first.
+            The destination folders must exist.
+        link: If True, duplicates are hard links, or copies where hard
+            links are not possible. If False, duplicates are independent
+            files: copy-on-write clones where the file system supports
+            them, or copies.
+    """
+    first, *others = dsts
+
+    logger.debug('"%s" -> "%s"', src, first)
+    _move(src, first)
+
+    if link:
+        for dst in others:
+            logger.debug('"%s" -> "%s"', first, dst)
+            _link(first, dst)
+    elif others:
+        logger.debug('"%s" -> %r', first, others)
+        _fanout_copy(first, others)
+
+
+def _batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yields lists of `size` items, the last one possibly shorter.
     """
-    if len(dsts) > 1:
-        move_fcn = copy2
-    else:
-        move_fcn = movefile
+    it = iter(items)
+    batch = list(islice(it, size))
+    while batch:
+        yield batch
+        batch = list(islice(it, size))
+
+
+def _move_batch(batch: List[Tuple[str, Collection[str]]],
+                link: bool) -> List[str]:
+    """Calls `move_to_many` for every item in the batch.
 
-    for dst in dsts:
-        logger.debug('"%s" -> "%s"', src, dst)
+    Returns:
+        A list of source files that could not be found.
+    """
+    failed = []
+    for src, dsts in batch:
         try:
-            move_fcn(src, dst)
+            move_to_many(src, dsts, link)
         except FileNotFoundError as err:
-            if isfile(src):
-                # The target directory doesn't exist.
-                makedirs(splitpath(dst)[0], exist_ok=True)
-                move_fcn(src, dst)
-            else:
-                # The source file doesn't exist.
-                raise err
-
-    if len(dsts) > 1:
-        remove(src)
+            failed.append(err.filename)
+    return failed
 
 
-def move_many_to_many(file_mapping: Dict[str, Collection[str]]) -> List[str]:
+def move_many_to_many(file_mapping: Dict[str, Collection[str]],
+                      link: bool = True) -> List[str]:
     """Apply `move_to_many` to all items in the file mapping.
 
     Args:
         file_mapping: A dictionary of file mappings from source file
-            to a collection of one or more target file names / folders.
+            to a collection of one or more target file names.
             `move_to_many` is (asynchronously) called for each item in
-            the dictionary.
+            the dictionary, in batches of up to `BATCH_SIZE` items.
+            Missing target folders are created first.
+        link: Passed on to `move_to_many`.
 
     Returns:
         A list of failed (source) file names. The move/copy failed with
@@ -56,14 +313,27 @@ def move_many_to_many(file_mapping: Dict[str, Collection[str]]) -> List[str]:
     """
     failed = []
 
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(move_to_many, move_from, move_to)
-                   for move_from, move_to in file_mapping.items()}
+    # Create the target folders up front, once each. A bare file name
+    # has no folder ('') and goes to the working directory.
+    for folder in {dirname(dst) for dsts in file_mapping.values()
+                   for dst in dsts} - {''}:
+        makedirs(folder, exist_ok=True)
 
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except FileNotFoundError as err:
-                failed.append(err.filename)
+    # Small mappings get smaller batches, to keep all workers busy.
+    size = max(1, min(BATCH_SIZE, len(file_mapping) // (MAX_WORKERS * 4)))
+
+    batches = _batched(file_mapping.items(), size)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # Keep two batches per worker in flight, not all of them.
+        pending = {executor.submit(_move_batch, batch, link)
+                   for batch in islice(batches, MAX_WORKERS * 2)}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                failed.extend(future.result())
+            pending.update(executor.submit(_move_batch, batch, link)
+                           for batch in islice(batches, len(done)))
 
     return failed
@@ -1,16 +1,19 @@
-from collections import defaultdict
+from functools import lru_cache
 from itertools import count
-from os.path import join as joinpath, splitext
-from typing import Callable, Dict
+from os.path import join as joinpath
+from typing import Callable, Dict, Tuple
 
 from lrlib.wfindex import Asset
 
 
 # https://helpx.adobe.com/lightroom-classic/kb/video-support-lightroom.html
-VIDEO_EXTS = {'.3gp', '.3gpp', '.avi', '.m2t', '.m2ts', '.m4v', '.mov', '.mpg',
-              '.mp2', '.mp4', '.mpeg', '.mts', '.wmv'}
+VIDEO_EXTS = frozenset({'.3gp', '.3gpp', '.avi', '.m2t', '.m2ts', '.m4v',
+                        '.mov', '.mpg', '.mp2', '.mp4', '.mpeg', '.mts',
+                        '.wmv'})
+_is_video = VIDEO_EXTS.__contains__
 
 
+@lru_cache(maxsize=64)
 def map_ext(ext: str) -> str:
     """Guess the file extension of exported assets.
 
@@ -22,7 +25,44 @@ def map_ext(ext: str) -> str:
     Returns:
         The expected file extension after exporting from Lightroom.
     """
-    return ext if ext.lower() in VIDEO_EXTS else '.jpg'
+    return ext if _is_video(ext.lower()) else '.jpg'
+
+
+def split_ext(filename: str) -> Tuple[str, str]:
+    """Split a file name into its base name and extension.
+
+    Like `os.path.splitext`, but without the search for path separators
+    because asset file names never contain any.
+
+    Args:
+        filename: Asset file name.
+
+    Returns:
+        A tuple `(base_name, ext)` where `ext` is empty or starts with a
+        dot.
+    """
+    dot = filename.rfind('.')
+    if dot <= 0:
+        return filename, ''
+    return filename[:dot], filename[dot:]
+
+
+def natural_name(filename: str, ix: int) -> str:
+    """Returns the exported file name of the ix-th asset named filename.
+
+    Args:
+        filename: Original asset file name.
+        ix: The occurrence of this file name, counting from 1.
+
+    Returns:
+        The file name `<filename>.jpg` for the first occurrence and
+        `<filename>-<ix>.jpg` for later ones.
+    """
+    base_name, ext = split_ext(filename)
+    new_ext = map_ext(ext)
+    if ix == 1:
+        return base_name + new_ext
+    return f'{base_name}-{ix:d}{new_ext}'
 
 
 class AssetNamer(Callable[[Asset], str]):
@@ -30,6 +70,7 @@ class AssetNamer(Callable[[Asset], str]):
 
     Attributes:
         folder: The base folder, prepended to all generated file names.
+        prefix: The folder including a trailing path separator.
     """
     def __init__(self, folder: str) -> None:
         """Creates the asset namer.
@@ -38,6 +79,7 @@ class AssetNamer(Callable[[Asset], str]):
             folder: Base folder to be prepended to file names.
         """
         self.folder = folder
+        self.prefix = joinpath(folder, '')
 
     def __call__(self, asset: Asset) -> str:
         """Returns the non-conflicting file name for a given asset.
@@ -60,6 +102,7 @@ class IndexedNamer(AssetNamer):
 
     Attributes:
         folder: The base folder, prepended to all generated file names.
+        prefix: The folder including a trailing path separator.
     """
 
     def __init__(self, folder: str) -> None:
@@ -70,6 +113,7 @@ class IndexedNamer(AssetNamer):
         """
         super().__init__(folder)
         self.index = count(start=1)
+        self._next_index = self.index.__next__
 
     def __call__(self, asset: Asset) -> str:
         """Returns the non-conflicting file name for a given asset.
@@ -82,10 +126,8 @@ class IndexedNamer(AssetNamer):
             `<self.folder>/<index>.<asset.filename>.jpg` where index is
             increased by 1 for every call to this function.
         """
-        base_name, ext = splitext(str(asset.filename))
-        return joinpath(self.folder, '{:d}.{:s}{:s}'.format(next(self.index),
-                                                            base_name,
-                                                            map_ext(ext)))
+        base_name, ext = split_ext(asset.filename)
+        return f'{self.prefix}{self._next_index():d}.{base_name}{map_ext(ext)}'
 
 
 class NaturalNamer(AssetNamer):
@@ -97,6 +139,10 @@ class NaturalNamer(AssetNamer):
 
     Attributes:
         folder: The base folder, prepended to all generated file names.
+        prefix: The folder including a trailing path separator.
+        registry: The file name given to each asset ID, without the
+            prefix. One folder holds many assets, so the prefix is not
+            stored once per asset.
     """
     def __init__(self, folder: str) -> None:
         """Creates the asset namer.
@@ -105,7 +151,7 @@ class NaturalNamer(AssetNamer):
             folder:
         """
         super().__init__(folder)
-        self.index: Dict[str, count] = defaultdict(lambda: count(start=1))
+        self.index: Dict[str, int] = {}
         self.registry: Dict[str, str] = {}
 
     def __call__(self, asset: Asset) -> str:
@@ -121,12 +167,11 @@ class NaturalNamer(AssetNamer):
             with the same name. So the first is simply named:
             `<self.folder>/<asset.filename>.jpg`.
         """
-        try:
-            filename = self.registry[asset.assetId]
-        except KeyError:
+        filename = self.registry.get(asset.assetId)
+        if filename is None:
             filename = self.registry[asset.assetId] =\
                        self._make_filename(asset.filename)
-        return filename
+        return self.prefix + filename
 
     def _make_filename(self, filename: str) -> str:
         """Avoids naming conflicts between matching file names.
@@ -136,13 +181,7 @@ class NaturalNamer(AssetNamer):
 
         Returns:
             Mapped file name that avoids conflict with other assets of
-            the same original file name.
+            the same original file name. It does not include the folder.
         """
-        base_name, ext = splitext(filename)
-        new_ext = map_ext(ext)
-        ix = next(self.index[filename])
-        if ix == 1:
-            filename = base_name + new_ext
-        else:
-            filename = '{:s}-{:d}.{:s}'.format(base_name, ix, new_ext)
-        return joinpath(self.folder, filename)
+        ix = self.index[filename] = self.index.get(filename, 0) + 1
+        return natural_name(filename, ix)